@@ -1,22 +1,55 @@
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, Response, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from fastapi.middleware.gzip import GZipMiddleware
 import httpx
 import os
-import json
-from pydantic import BaseModel 
+import orjson
+from pydantic import BaseModel, BeforeValidator, ConfigDict, ValidationError
+from typing import Annotated
 import asyncio
-import gspread
-import matplotlib.pyplot as plt
-from google.oauth2.service_account import Credentials
-from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+import numpy as np
+from email.utils import formatdate
 from pathlib import Path
+from dataclasses import dataclass, field
 import collections
+import functools
+import array
 import time
 import hmac
-import hashlib
 import math
+import random
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 🪵 logging：QueueHandler.prepare() 仍在呼叫端把訊息 % 參數組好再丟進 queue；
+#    加時間 / 等級前綴與寫 stream 的 I/O 交給背景 QueueListener thread
+logger = logging.getLogger("bybit")
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_stream = logging.StreamHandler()
+_log_stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+# 🕒 台北時間字串：同一秒內的事件共用同一個格式化結果，不必每筆都建 datetime + strftime
+TZ_TW_OFFSET = 8 * 3600
+_ts_cache = [0, ""]
+
+def now_str() -> str:
+    sec = int(time.time())
+    if sec != _ts_cache[0]:
+        _ts_cache[:] = [sec, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(sec + TZ_TW_OFFSET))]
+    return _ts_cache[1]
 
 # ——— 小工具：空字串/None 時回傳預設值 0.0 ———
 def safe_float(val: str | float | int | None, default: float = 0.0) -> float:
@@ -24,39 +57,272 @@ def safe_float(val: str | float | int | None, default: float = 0.0) -> float:
         return float(val)
     except (TypeError, ValueError):
         return default
-        
-app = FastAPI()
+
+# ——— 小工具：None 時回傳空字串，數字等其它型別轉成 str（對應舊版 payload.get 的寬鬆行為）———
+def safe_str(val) -> str:
+    return "" if val is None else val if isinstance(val, str) else str(val)
+
+# ✅ App 生命週期：啟動時建共用 HTTP client、開 log / Google Sheets 背景寫入 worker，關閉時收掉
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 🌐 共用 HTTP client：保留 keep-alive 連線池（HTTP/2），Bybit / LINE 呼叫不必每次重做 TCP+TLS 握手
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60),
+        timeout=httpx.Timeout(10.0),
+    )
+    await init_gsheet()
+    workers = [asyncio.create_task(log_worker()), asyncio.create_task(gsheet_worker())]
+    yield
+    for worker in workers:
+        worker.cancel()
+    for worker in workers:
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+    await drain_log_queue()
+    await drain_gsheet_queue()
+    # 等 writer thread 收尾但不卡 event loop；Sheets 那條最多等到 gspread 的 HTTP timeout
+    await asyncio.gather(asyncio.to_thread(_LOG_POOL.shutdown), asyncio.to_thread(_GSHEET_POOL.shutdown))
+    await app.state.http.aclose()
+
+# 🚀 啟動方式：uvicorn bybit_a203_ethusdt:app --host 0.0.0.0 --port 10000 --loop uvloop --http httptools --workers 1
+# ⚠️ workers / WEB_CONCURRENCY 必須維持 1：recent_logs、dashboard 快取、log / Sheets queue 都在本行程記憶體，
+#    log.jsonl 輪替也靠本行程的 _log_lock；多個 worker 會各自一份狀態、dashboard 不一致且輪替互踩
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)   # dict 回應一律走 orjson
+# 🗜️ 大回應（log.jsonl 下載、/logs.json、dashboard 頁）依 Accept-Encoding 即時 gzip；
+#    小的 JSON 回應低於門檻直接原樣送，不付壓縮成本
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
 
 Path("static").mkdir(parents=True, exist_ok=True)  # 📁 確保 static 資料夾存在
 app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
 
 Path("log").mkdir(parents=True, exist_ok=True)
-log_json_path = "log/log.json"
-if not Path(log_json_path).exists():
-    with open(log_json_path, "w") as f:
-        json.dump([], f)
-
-# ✅ 預先產生靜態圖，避免 logs_dashboard 載入時圖片 404
-for fname in ["mdd_distribution.png", "equity_curve.png", "win_rate.png"]:
-    fpath = Path(f"static/{fname}")
-    if not fpath.exists():
-        plt.figure(figsize=(3, 2))
-        plt.text(0.5, 0.5, "No Data", fontsize=12, ha="center")
-        plt.axis("off")
-        plt.tight_layout()
-        plt.savefig(fpath)
-        plt.close()
+log_json_path  = "log/log.json"      # 舊版整包 JSON 陣列（僅供一次性轉檔）
+log_jsonl_path = "log/log.jsonl"     # ✅ 新版 JSON Lines：一筆事件一行，只追加不重寫
+
+# 📎 log.jsonl 只開一次：unbuffered + O_APPEND，每筆就是一次 write(2)，不再每次 open/close
+#    "ab" 不存在就建立，不需要先 touch / exists 檢查
+_log_fh = open(log_jsonl_path, "ab", buffering=0)
+atexit.register(lambda: _log_fh.close())
+_log_lock = threading.Lock()   # append_logs 在 worker thread 跑，輪替換檔時要擋住其他寫入
+
+# 🔁 舊 log.json 存在且 JSONL 仍是空的 → 轉成 JSONL（大小從已開的 fd 取，不再另外 stat 路徑）
+if os.fstat(_log_fh.fileno()).st_size == 0 and os.path.isfile(log_json_path):
+    try:
+        old_records = orjson.loads(Path(log_json_path).read_bytes())
+        # 與 append_logs 同格式（orjson 緊湊輸出），一次 write 寫完
+        _log_fh.write(b"".join(orjson.dumps(r) + b"\n" for r in old_records))
+        # 轉完就改名：輪替後 log.jsonl 又是空檔，這時重啟不能再把整包舊歷史匯入一次
+        os.replace(log_json_path, log_json_path + ".migrated")
+    except Exception as e:
+        logger.warning("[⚠️ log.json 轉檔失敗]：%s", e)
+
+# 🧾 最近 DASHBOARD_MAX_RECORDS 筆事件留在記憶體，dashboard 直接讀這裡、不碰檔案
+DASHBOARD_MAX_RECORDS = 1000
+recent_logs: collections.deque = collections.deque(maxlen=DASHBOARD_MAX_RECORDS)
+_BOOT_ID = f"{time.time_ns():x}"
+
+# 📊 log 版本 + dashboard 快取放同一個 slots 物件：固定屬性存取，不用每次查 dict
+@dataclass(slots=True)
+class LogState:
+    version: int = 0                                   # 每寫一筆 +1，dashboard 快取 / ETag 以此判斷是否過期
+    updated: float = field(default_factory=time.time)  # 最後一次寫入時間（Last-Modified）
+    payload_version: int | None = None                 # 已序列化的 dashboard JSON 對應哪個 version
+    payload: bytes | None = None
+
+log_state = LogState()
+
+# 🔄 檔案超過 LOG_ROTATE_BYTES 就改名成 log-YYYYMMDD-HHMMSS.jsonl（同一秒再輪替加 _001、_002…），另開新檔
+LOG_ROTATE_BYTES = int(os.getenv("LOG_ROTATE_BYTES", str(50 * 1024 * 1024)))
+# 💾 每批寫完 fsync 一次：只在 log-writer thread 裡等磁碟，event loop 不受影響；掉電也不丟已回應過的事件
+LOG_FSYNC = os.getenv("LOG_FSYNC", "true").lower() == "true"
+# 🧹 輪替後最多保留 LOG_KEEP_ROTATED 個舊檔，超過就刪最舊的；0 = 全部保留（預設，不主動刪資料）
+LOG_KEEP_ROTATED = int(os.getenv("LOG_KEEP_ROTATED", "0"))
+
+# 🗂️ 每個 strategy_id 的歷史筆數（log.jsonl + 所有輪替檔）：第一次查 /status 時掃檔建立，
+#    之後由 append_logs 在 _log_lock 內增量更新，輪替只是換檔、筆數照算；/status 變成一次 dict 查詢
+_strategy_counts: collections.Counter | None = None
+
+def rotated_log_paths() -> list:
+    # 檔名時戳固定寬度、同秒序號補零，字典序即時間序
+    return sorted(Path("log").glob("log-*.jsonl"))
+
+def _rotate_log():
+    global _log_fh, _strategy_counts
+    # 舊 handle 開著時先改名、開好新檔才關舊的：任何一步失敗都還有可寫的 handle，不會整個行程停寫 log
+    try:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        target, n = Path(f"log/log-{stamp}.jsonl"), 0
+        while target.exists():   # os.replace 會直接蓋掉同名檔：同一秒輪替兩次要換名字
+            n += 1
+            target = Path(f"log/log-{stamp}_{n:03d}.jsonl")
+        os.replace(log_jsonl_path, target)
+        new_fh = open(log_jsonl_path, "ab", buffering=0)
+    except OSError as e:
+        logger.warning("[⚠️ log.jsonl 輪替失敗，沿用原檔]：%s", e)
+        return
+    old_fh, _log_fh = _log_fh, new_fh
+    old_fh.close()
+    if LOG_KEEP_ROTATED > 0:
+        try:
+            pruned = rotated_log_paths()[:-LOG_KEEP_ROTATED]
+            for old in pruned:
+                old.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning("[⚠️ 舊 log 清理失敗]：%s", e)
+            pruned = True   # 可能刪了一部分，索引一樣要重建
+        if pruned:
+            _strategy_counts = None   # 刪掉的歷史不再算，下次 /status 依現存檔案重建
+
+# ——— log 讀寫：寫入只 append（一批合成一次 write），讀取逐行解析 ———
+def append_logs(records: list):
+    data = b"".join(orjson.dumps(r) + b"\n" for r in records)
+    with _log_lock:
+        _log_fh.write(data)
+        if LOG_FSYNC:
+            os.fsync(_log_fh.fileno())
+        if _strategy_counts is not None:
+            _strategy_counts.update(r.get("strategy_id") for r in records)
+        if _log_fh.tell() >= LOG_ROTATE_BYTES:
+            _rotate_log()
+
+# 🧵 log.jsonl 與 Google Sheets 各有自己的單一 writer thread：卡住的 Sheets 呼叫不會讓 log 落盤排在後面，
+#    也不和 to_thread 的預設 pool 搶 thread
+_LOG_POOL    = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-writer")
+_GSHEET_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gsheet-writer")
+
+def run_in_pool(pool: ThreadPoolExecutor, func, *args) -> asyncio.Future:
+    return asyncio.get_running_loop().run_in_executor(pool, func, *args)
+
+# 📬 webhook 只把事件丟進 queue 就回應；記憶體中的 recent_logs 立即更新，檔案由 log_worker 批次寫
+LOG_BATCH_SIZE = 100
+log_queue: asyncio.Queue = asyncio.Queue()
+
+def log_event(record: dict):
+    recent_logs.append(record)
+    log_state.version += 1
+    log_state.updated = time.time()
+    log_queue.put_nowait(record)
+
+async def log_worker():
+    while True:
+        batch = [await log_queue.get()]
+        # 有積壓就一次拿走（最多 LOG_BATCH_SIZE 筆），合成一次 write
+        while len(batch) < LOG_BATCH_SIZE and not log_queue.empty():
+            batch.append(log_queue.get_nowait())
+        try:
+            await run_in_pool(_LOG_POOL, append_logs, batch)
+        except Exception as e:
+            logger.error("[⚠️ log.jsonl 寫入失敗]：%s（%d 筆）", e, len(batch))
+
+async def drain_log_queue():
+    batch = []
+    while not log_queue.empty():
+        batch.append(log_queue.get_nowait())
+    if batch:
+        await run_in_pool(_LOG_POOL, append_logs, batch)
+
+# 🩹 壞行（當機 / 磁碟滿留下的半行）只記 warning 跳過，不讓一行毀掉 /status 索引或 dashboard 載入
+def _parse_log_lines(lines, path):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            logger.warning("[⚠️ log 壞行已略過] %s：%s", path, e)
+
+# 逐行 yield，不把整份 log 載進記憶體
+def iter_logs(path=log_jsonl_path):
+    with open(path, "rb") as f:
+        yield from _parse_log_lines(f, path)
+
+def count_strategy_logs(strategy_id: str) -> int:
+    global _strategy_counts
+    if _strategy_counts is None:
+        with _log_lock:   # 建索引時擋住 writer，掃檔結果與之後的增量更新才接得上
+            if _strategy_counts is None:
+                counts = collections.Counter()
+                for path in [*rotated_log_paths(), log_jsonl_path]:
+                    counts.update(r.get("strategy_id") for r in iter_logs(path))
+                _strategy_counts = counts
+    return _strategy_counts.get(strategy_id, 0)
+
+# 📜 只讀檔尾 max_bytes：不管 log 多大，啟動時載入 dashboard 的成本固定
+def read_log_tail(max_bytes: int = 512 * 1024) -> list:
+    with open(log_jsonl_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - max_bytes))
+        if size > max_bytes:
+            f.readline()   # 丟掉被切斷的第一行
+        return list(_parse_log_lines(f, log_jsonl_path))
 
-SHEET_URL = os.getenv("GOOGLE_SHEET_URL")
-sheet = None
 try:
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_file("bybit-webhook-a203-logs-7a34c85019dd.json", scopes=scope)
-    gs_client = gspread.authorize(creds)
-    sheet = gs_client.open_by_url(SHEET_URL).worksheet("bybit_webhook logs")
+    recent_logs.extend(read_log_tail())
 except Exception as e:
-    print(f"[⚠️ Google Sheets 初始化失敗]：{e}")
+    logger.warning("[⚠️ log.jsonl 載入失敗]：%s", e)
+
+SHEET_URL = os.getenv("GOOGLE_SHEET_URL")
+GSHEET_CREDENTIALS_FILE = "bybit-webhook-a203-logs-7a34c85019dd.json"
+GSHEET_SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+sheet = None   # lifespan 啟動時由 init_gsheet() 設定；None 代表 Sheets 不可用
+
+# 🔑 讀金鑰檔 + 授權 + 開 worksheet 都是同步 I/O：不在 import 時做，改在 lifespan 裡丟 thread 跑一次
+#    （fork / --preload 之後才建連線）；lru_cache 讓同一行程重複呼叫只付一次成本
+@functools.lru_cache(maxsize=1)
+def open_gsheet():
+    try:
+        # gspread / google-auth 只有 Sheets 用得到：延到這裡才 import，webhook 熱路徑與冷啟動不付這筆成本
+        import gspread
+        from google.oauth2.service_account import Credentials
+        creds = Credentials.from_service_account_file(GSHEET_CREDENTIALS_FILE, scopes=GSHEET_SCOPES)
+        gc = gspread.authorize(creds)
+        gc.set_timeout(GSHEET_TIMEOUT)   # gspread 預設不設 HTTP timeout，卡住的請求會永遠佔著 writer thread
+        ws = gc.open_by_url(SHEET_URL).worksheet("bybit_webhook logs")
+    except Exception as e:
+        logger.warning("[⚠️ Google Sheets 初始化失敗]：%s", e)
+        return None
+    # 🧾 表頭只在啟動時核對一次，之後每批 append_rows 只剩一次 API 呼叫
+    try:
+        if ws.row_values(1) != EXPECTED_GSHEET_HEADERS:
+            ws.update("A1:O1", [EXPECTED_GSHEET_HEADERS])
+    except Exception as e:
+        logger.warning("[⚠️ Google Sheets 表頭檢查失敗]：%s", e)
+    return ws
+
+async def init_gsheet():
+    global sheet
+    sheet = await asyncio.to_thread(open_gsheet)
+
+EXPECTED_GSHEET_HEADERS = [
+    "pine_time", "server_time",
+    "strategy_id", "event", "equity", "drawdown",
+    "order_action", "trigger_type", "comment", "contracts",
+    "ret_code", "ret_msg", "pnl", "price", "qty"
+]
+
+# 📬 待寫入 Google Sheets 的列，由 gsheet_worker 在背景消化，不卡住 webhook
+gsheet_queue: asyncio.Queue = asyncio.Queue()
+
+# 📦 批次寫入：累積到 GSHEET_BATCH_SIZE 列或距上次寫入超過 GSHEET_FLUSH_INTERVAL 秒才送一次 append_rows
+GSHEET_BATCH_SIZE     = 50
+GSHEET_FLUSH_INTERVAL = 2.0
+# ✂️ 單次 append_rows 最多送這麼多列：積壓再多也切片送，一次非 429 失敗最多只丟這一片
+GSHEET_MAX_ROWS_PER_CALL = 500
+_pending_rows: list   = []
+_last_gsheet_flush    = time.monotonic()
+# Sheets 本來就限制單一寫入者。timeout 設在 gspread 的 HTTP 層，thread 裡的呼叫才會真的結束；
+#    await 端多留一點餘裕當保險。semaphore 等 thread 跑完才放，不會有兩個 append_rows 同時在跑
+GSHEET_TIMEOUT       = 20.0
+GSHEET_AWAIT_TIMEOUT = GSHEET_TIMEOUT + 5.0
+_gsheet_sem          = asyncio.Semaphore(1)
+# ⏳ 遇到 429（寫入配額用完）時整批放回 _pending_rows，指數退避 + jitter 後重送；超過次數才放棄
+GSHEET_MAX_RETRIES  = 5
+GSHEET_BACKOFF_BASE = 1.0
+GSHEET_BACKOFF_MAX  = 60.0
+_gsheet_retries     = 0
 
 def write_to_gsheet(
          pine_time, server_time,
@@ -66,169 +332,342 @@ def write_to_gsheet(
          comment=None, contracts=None,
          ret_code=None, ret_msg=None,
          pnl=None, price=None, qty=None):
+    if not sheet:
+        return
+    row = [
+        pine_time, server_time,
+        strategy_id, event,
+        equity, drawdown,
+        order_action, trigger_type,
+        comment, contracts,
+        ret_code, ret_msg,
+        pnl, price, qty
+    ]
+    logger.debug("[📝 準備寫入資料] %s", row)
+    gsheet_queue.put_nowait(row)
+
+# gspread 是同步 HTTP 呼叫，只能在 worker thread 裡跑
+def _append_gsheet_rows(rows: list):
+    # INSERT_ROWS：在表格尾端插入新列，不覆寫既有資料；RAW 不做公式 / 格式解析
+    sheet.append_rows(rows, value_input_option="RAW", insert_data_option="INSERT_ROWS")
+
+def _on_gsheet_write_done(fut: asyncio.Future):
+    _gsheet_sem.release()
+    if not fut.cancelled():
+        fut.exception()   # await 端若已 timeout 放棄，這裡把例外取走，避免 "never retrieved" 警告
+
+def _is_rate_limited(e: Exception) -> bool:
+    from gspread.exceptions import APIError   # 走到這裡 open_gsheet 早已 import 過，只是查 sys.modules
+    return isinstance(e, APIError) and getattr(e.response, "status_code", None) == 429
+
+async def flush_gsheet_rows(retry: bool = True):
+    global _last_gsheet_flush, _gsheet_retries
+    _last_gsheet_flush = time.monotonic()
+    if not _pending_rows:
+        return
+    batch = _pending_rows[:GSHEET_MAX_ROWS_PER_CALL]
+    del _pending_rows[:len(batch)]
     try:
-        if sheet:
-            expected_headers = [
-                "pine_time", "server_time",
-                "strategy_id", "event", "equity", "drawdown",
-                "order_action", "trigger_type", "comment", "contracts",
-                "ret_code", "ret_msg", "pnl", "price", "qty"
-            ]
-            headers = sheet.row_values(1)
-            if headers != expected_headers:
-                sheet.update("A1:O1", [expected_headers])
-            row = [
-                pine_time, server_time,
-                strategy_id, event,
-                equity, drawdown,
-                order_action, trigger_type,
-                comment, contracts,
-                ret_code, ret_msg,
-                pnl, price, qty
-            ]
-            print(f"[📝 準備寫入資料] {row}")
-            sheet.append_row(row)
+        await _gsheet_sem.acquire()
+        try:
+            fut = run_in_pool(_GSHEET_POOL, _append_gsheet_rows, batch)
+        except BaseException:
+            _gsheet_sem.release()
+            raise
+        fut.add_done_callback(_on_gsheet_write_done)
+        # shield：await 端 timeout 只是不再等，thread 跑完時 callback 才放 semaphore
+        await asyncio.wait_for(asyncio.shield(fut), timeout=GSHEET_AWAIT_TIMEOUT)
+        _gsheet_retries = 0
     except Exception as e:
-        print(f"[⚠️ Google Sheets 寫入失敗]：{e}")
+        # timeout 不重送：thread 裡的 append_rows 可能其實已寫進去，重送會重複
+        if retry and _is_rate_limited(e) and _gsheet_retries < GSHEET_MAX_RETRIES:
+            _pending_rows[:0] = batch
+            delay = min(GSHEET_BACKOFF_MAX, GSHEET_BACKOFF_BASE * 2 ** _gsheet_retries)
+            delay += random.uniform(0, delay / 2)
+            _gsheet_retries += 1
+            logger.warning("[⏳ Google Sheets 429] %.1f 秒後重送（第 %d 次，%d 列）", delay, _gsheet_retries, len(batch))
+            await asyncio.sleep(delay)
+            return
+        _gsheet_retries = 0
+        logger.warning("[⚠️ Google Sheets 寫入失敗]：%s（%d 列）", e, len(batch))
+
+async def gsheet_worker():
+    while True:
+        # 有待寫入的列時，最多只等到這一輪的 flush 時間點
+        timeout = None
+        if _pending_rows:
+            timeout = max(0.0, GSHEET_FLUSH_INTERVAL - (time.monotonic() - _last_gsheet_flush))
+        try:
+            _pending_rows.append(await asyncio.wait_for(gsheet_queue.get(), timeout=timeout))
+        except asyncio.TimeoutError:
+            pass
+        # 積壓（例如 429 退避期間）一次全部收進來，再以 GSHEET_MAX_ROWS_PER_CALL 切片連續送完，
+        #    不必每片都等 GSHEET_FLUSH_INTERVAL；某一片失敗只丟那一片
+        while not gsheet_queue.empty():
+            _pending_rows.append(gsheet_queue.get_nowait())
+        while _pending_rows and (len(_pending_rows) >= GSHEET_BATCH_SIZE
+                                 or time.monotonic() - _last_gsheet_flush >= GSHEET_FLUSH_INTERVAL):
+            await flush_gsheet_rows()
+
+# 🛑 關機前把 queue 裡剩下的列全部寫出去
+async def drain_gsheet_queue():
+    while not gsheet_queue.empty():
+        _pending_rows.append(gsheet_queue.get_nowait())
+    while _pending_rows:
+        await flush_gsheet_rows(retry=False)   # 關機中不等退避；仍逐片送，失敗只丟該片
+
+# 📣 LINE 推送上限 8 個同時進行；LINE 變慢時排隊等，不會無限制地開連線
+LINE_CONCURRENCY = 8
+_line_sem = asyncio.Semaphore(LINE_CONCURRENCY)
+# 共用 app.state.http 的連線池；LINE 只是通知，timeout 比 Bybit 的 10 秒短，卡住時早點放掉 semaphore
+LINE_PUSH_URL = "https://api.line.me/v2/bot/message/push"
+# 是否啟用 LINE 推送與推送對象：環境變數在程序生命週期內不變，import 時讀一次
+USE_LINE_NOTIFY    = os.getenv("USE_LINE_NOTIFY", "false").lower() == "true"
+LINE_USER_ID       = os.getenv("LINE_USER_ID")
+LINE_CHANNEL_TOKEN = os.getenv("LINE_CHANNEL_TOKEN")
+# 推送 header 只跟 token 有關，先組好，每次推送只換 body
+LINE_HEADERS = {
+    "Authorization": f"Bearer {LINE_CHANNEL_TOKEN}",
+    "Content-Type": "application/json"
+}
+LINE_TIMEOUT  = httpx.Timeout(3.0)
+# create_task 只留弱參考，pending 的背景任務要自己 hold 住，避免被 GC 掉
+_bg_tasks = set()
 
 async def push_line_message(msg: str):
-    use_line = os.getenv("USE_LINE_NOTIFY", "false").lower() == "true"
-    if not use_line:
-        print("[⚠️] USE_LINE_NOTIFY 為 false，已略過 LINE 推送")
+    if not USE_LINE_NOTIFY:
+        logger.info("[⚠️] USE_LINE_NOTIFY 為 false，已略過 LINE 推送")
         return
 
-    LINE_USER_ID = os.getenv("LINE_USER_ID")
-    LINE_CHANNEL_TOKEN = os.getenv("LINE_CHANNEL_TOKEN")
     if not LINE_USER_ID or not LINE_CHANNEL_TOKEN:
-        print("[⚠️] 未設定 LINE_USER_ID 或 LINE_CHANNEL_TOKEN")
+        logger.warning("[⚠️] 未設定 LINE_USER_ID 或 LINE_CHANNEL_TOKEN")
         return
-    headers = {
-        "Authorization": f"Bearer {LINE_CHANNEL_TOKEN}",
-        "Content-Type": "application/json"
-    }
     body = {
         "to": LINE_USER_ID,
         "messages": [{"type": "text", "text": msg}]
     }
-    async with httpx.AsyncClient() as client:
-        r = await client.post("https://api.line.me/v2/bot/message/push", headers=headers, json=body)
-        print("[LINE 回應]", r.status_code, await r.aread())
-
-# ✅ Bybit 下單模組
+    async with _line_sem:
+        r = await app.state.http.post(LINE_PUSH_URL, headers=LINE_HEADERS, content=orjson.dumps(body),
+                                      timeout=LINE_TIMEOUT)
+    logger.info("[LINE 回應] %s %s", r.status_code, r.content)
+
+def _on_line_task_done(task: asyncio.Task):
+    _bg_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("[⚠️ LINE 推送失敗] %s", task.exception())
+
+# 🚀 不等 LINE 回應就讓 request 先回；結果與錯誤都只記 log
+def notify_line(msg: str):
+    if not USE_LINE_NOTIFY:   # 沒啟用就連 task 都不建
+        return
+    task = asyncio.create_task(push_line_message(msg))
+    _bg_tasks.add(task)
+    task.add_done_callback(_on_line_task_done)
+
+# 🔑 Bybit 設定在程序生命週期內不變，import 時讀一次
+BYBIT_API_KEY          = os.getenv("BYBIT_API_KEY") or ""
+BYBIT_API_SECRET_BYTES = (os.getenv("BYBIT_API_SECRET") or "").encode()
+BYBIT_BASE_URL         = os.getenv("BYBIT_API_URL", "https://api-testnet.bybit.com")
+BYBIT_ORDER_ENDPOINT   = f"{BYBIT_BASE_URL}/v5/order/create"
+BYBIT_RECV_WINDOW      = "5000"
+# 取不到餘額時的備用 equity
+EQUITY_FALLBACK        = safe_float(os.getenv("EQUITY_FALLBACK", "100"))
+# 簽名字串 = timestamp + api_key + recv_window + payload/query；中間那段不變，先編好 bytes
+BYBIT_SIGN_PREFIX_BYTES = (BYBIT_API_KEY + BYBIT_RECV_WINDOW).encode()
+# 簽名 header 的固定欄位，每次只補 timestamp / sign
+BYBIT_AUTH_HEADERS  = {"X-BAPI-API-KEY": BYBIT_API_KEY, "X-BAPI-RECV-WINDOW": BYBIT_RECV_WINDOW}
+BYBIT_ORDER_HEADERS = {**BYBIT_AUTH_HEADERS, "Content-Type": "application/json"}
+
+# ⏱️ Bybit 毫秒時間戳：time_ns 整數除法，不經 float 乘法與截斷
+def bybit_ts() -> str:
+    return str(time.time_ns() // 1_000_000)
+
+# 🔏 Bybit HMAC-SHA256 簽名：hmac.digest 走 OpenSSL one-shot，不建 HMAC 物件
+def bybit_sign(message: bytes) -> str:
+    return hmac.digest(BYBIT_API_SECRET_BYTES, message, "sha256").hex()
+
+# 📦 下單 payload 的固定欄位只建一次；市价单不需要 timeInForce，也不要带 price
+BYBIT_ORDER_BASE = {"category": "linear", "orderType": "Market"}
+
+# 👛 Unified 帳戶錢包查詢：簽名 / 請求 / 解析只有這一份，tv_webhook、fetch_equity、/equity_status 共用
+BYBIT_WALLET_QUERY       = "accountType=UNIFIED"
+BYBIT_WALLET_QUERY_BYTES = BYBIT_WALLET_QUERY.encode()
+BYBIT_WALLET_ENDPOINT    = f"{BYBIT_BASE_URL}/v5/account/wallet-balance?{BYBIT_WALLET_QUERY}"
+
+async def fetch_wallet_account() -> dict:
+    timestamp = bybit_ts()
+    signature = bybit_sign(timestamp.encode() + BYBIT_SIGN_PREFIX_BYTES + BYBIT_WALLET_QUERY_BYTES)
+    headers   = {**BYBIT_AUTH_HEADERS, "X-BAPI-TIMESTAMP": timestamp, "X-BAPI-SIGN": signature}
+    data = orjson.loads((await app.state.http.get(BYBIT_WALLET_ENDPOINT, headers=headers)).content)
+    logger.debug("[📦 Bybit API 回傳] %s", data)
+    return data["result"]["list"][0]
+
+def usdt_coin(account: dict) -> dict | None:
+    return next((c for c in account["coin"] if c["coin"] == "USDT"), None)
+
+# 💰 tv_webhook 的可用餘額 TTL 快取：連發的訊號在 EQUITY_CACHE_TTL 秒內共用同一份錢包資料，
+#    _wallet_lock 讓同時進來的請求只打一次 Bybit；place_order 之後立即失效，不拿下單前的舊餘額算倉位
+EQUITY_CACHE_TTL = float(os.getenv("EQUITY_CACHE_TTL", "3"))
+_wallet_cache: tuple | None = None   # (time.monotonic(), USDT coin dict 或 None)
+_wallet_lock = asyncio.Lock()
+# 🔢 每次失效 +1：查詢途中若有別的策略下了單，查回來的是下單前的餘額，世代對不上就不寫回快取
+_wallet_gen = 0
+
+def invalidate_wallet_cache():
+    global _wallet_cache, _wallet_gen
+    _wallet_gen += 1
+    _wallet_cache = None
+
+async def cached_usdt_wallet() -> dict | None:
+    global _wallet_cache
+    cached = _wallet_cache
+    if cached is not None and time.monotonic() - cached[0] < EQUITY_CACHE_TTL:
+        return cached[1]
+    async with _wallet_lock:
+        cached = _wallet_cache
+        if cached is not None and time.monotonic() - cached[0] < EQUITY_CACHE_TTL:
+            return cached[1]
+        gen = _wallet_gen
+        usdt_info = usdt_coin(await fetch_wallet_account())
+        if gen == _wallet_gen:   # 失敗會在上面丟例外，不會快取
+            _wallet_cache = (time.monotonic(), usdt_info)
+        return usdt_info
+
+# ✅ Bybit 下單模組（回應 body 已由 httpx 讀進 .content，直接 orjson 解析，不走 stdlib json）
 async def place_order(symbol: str, side: str, qty: float, reduce_only: bool = False):
-    api_key = os.getenv("BYBIT_API_KEY")
-    api_secret = os.getenv("BYBIT_API_SECRET")
-    base_url = os.getenv("BYBIT_API_URL", "https://api-testnet.bybit.com")
-    endpoint = f"{base_url}/v5/order/create"
-
-    timestamp = str(int(time.time() * 1000))
-    recv_window = "5000"
-    # 市价单不需要 timeInForce，也不要带 price
-    payload = {
-        "category": "linear",
-        "symbol": symbol,
-        "side": side,
-        "orderType": "Market",
-        "qty": str(qty)
-    }
+    timestamp = bybit_ts()
+    payload = {**BYBIT_ORDER_BASE, "symbol": symbol, "side": side, "qty": str(qty)}
     # 如果是減倉單，帶上 reduce_only 參數
     if reduce_only:
         payload["reduce_only"] = True
         
-    payload_str = json.dumps(payload, separators=(",", ":"))
-    sign_str = timestamp + api_key + recv_window + payload_str
-    signature = hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
-    headers = {
-        "X-BAPI-API-KEY": api_key,
-        "X-BAPI-TIMESTAMP": timestamp,
-        "X-BAPI-RECV-WINDOW": recv_window,
-        "X-BAPI-SIGN": signature,
-        "Content-Type": "application/json"
-    }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(endpoint, headers=headers, data=payload_str)
-        print("[📤 Bybit 下單結果]", response.status_code, await response.aread())
-        return response.json()
+    # orjson 直接輸出緊湊 bytes：簽名與 request body 共用同一份，保證逐位元組一致
+    payload_bytes = orjson.dumps(payload)
+    sign_bytes = timestamp.encode() + BYBIT_SIGN_PREFIX_BYTES + payload_bytes
+    signature = bybit_sign(sign_bytes)
+    headers = {**BYBIT_ORDER_HEADERS, "X-BAPI-TIMESTAMP": timestamp, "X-BAPI-SIGN": signature}
+    try:
+        response = await app.state.http.post(BYBIT_ORDER_ENDPOINT, headers=headers, content=payload_bytes)
+    finally:
+        # 下過單餘額就變了，下一筆訊號要重抓；POST 逾時 / 斷線時 Bybit 仍可能已成交，一樣要失效
+        invalidate_wallet_cache()
+    logger.info("[📤 Bybit 下單結果] %s %s", response.status_code, response.content)
+    return orjson.loads(response.content)
 
 # ──────────────────────────────
 # 重新抓取 Bybit 帳戶 USDT Equity
-async def fetch_equity(api_key: str, api_secret: str, base_url: str) -> float:
-    ts          = str(int(time.time() * 1000))
-    recv_window = "5000"
-    qstr        = "accountType=UNIFIED"
-    sign_str    = ts + api_key + recv_window + qstr
-    sig         = hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
-
-    headers = {
-        "X-BAPI-API-KEY": api_key,
-        "X-BAPI-TIMESTAMP": ts,
-        "X-BAPI-RECV-WINDOW": recv_window,
-        "X-BAPI-SIGN": sig
-    }
-    async with httpx.AsyncClient() as client:
-        data = (await client.get(f"{base_url}/v5/account/wallet-balance?{qstr}",
-                                 headers=headers)).json()
-
-    usdt_info = next((c for c in data["result"]["list"][0]["coin"]
-                      if c["coin"] == "USDT"), {})
+async def fetch_equity() -> float:
+    usdt_info = usdt_coin(await fetch_wallet_account()) or {}
     return safe_float(
         usdt_info.get("equity") or
         usdt_info.get("totalAvailableBalance") or
         usdt_info.get("walletBalance"), 0.0)
 # ──────────────────────────────
 
+# 🧊 payload 只讀不改：frozen 省掉 __setattr__ 驗證路徑；未知欄位直接丟棄、不存進 model
 class WebhookPayloadData(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     action: str
     position_size: float
 
 class WebhookPayload(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     strategy_id: str
     signal_type: str
     time: str
-    trigger_type: str = None 
-    equity: float = None
-    symbol: str = None
-    order_type: str = None
-    data: WebhookPayloadData = None
-    secret: str = None
+    trigger_type: str | None = None
+    equity: float | None = None
+    symbol: str | None = None
+    order_type: str | None = None
+    data: WebhookPayloadData | None = None
+    secret: str | None = None
+
+# 📈 TradingView 下單訊號：數值欄位沿用 safe_float（空字串 / None → 0.0）、字串欄位走 safe_str（None → ""、數字轉字串），
+#    型別不對也不會 ValidationError 把訊號丟掉；一次驗證完、handler 直接取屬性；secret 已在 read_authed_payload 驗過，不進 model
+SafeFloat = Annotated[float, BeforeValidator(safe_float)]
+SafeStr   = Annotated[str, BeforeValidator(safe_str)]
+
+class TVWebhookPayload(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
+    strategy_id: SafeStr = ""
+    order_id: SafeStr = ""
+    trigger_type: SafeStr = ""
+    comment: SafeStr = ""
+    symbol: SafeStr = ""
+    price: SafeFloat = 0.0
+    capital_percent: SafeFloat = 0.0
+    contracts: SafeFloat = 0.0
+    time: SafeStr = ""
 
 # 🧠 根據 order_id 精準推斷動作方向與用途
+# 🏷️ order_id 前綴 → 中文動作；彼此互不為前綴，比對順序不影響結果
+ORDER_ACTION_LABELS = {
+    "entry_long": "多單建倉",
+    "entry_short": "空單建倉",
+    "tp1_long": "多單止盈",
+    "tp1_short": "空單止盈",
+    "trail_long": "多單移動止損",
+    "trail_short": "空單移動止損",
+    "stop_loss_long": "多單止損",
+    "stop_loss_short": "空單止損",
+    "breakeven_long": "多單套保",
+    "breakeven_short": "空單套保",
+    "residual_close_long": "多單清殘倉",
+    "residual_close_short": "空單清殘倉",
+    "close_long_for_short": "多單反手轉空",
+    "close_short_for_long": "空單反手轉多",
+}
+
 def infer_action_from_order_id(order_id: str) -> str:
-    if order_id.startswith("entry_long"):
-        return "多單建倉"
-    elif order_id.startswith("entry_short"):
-        return "空單建倉"
-    elif order_id.startswith("tp1_long"):
-        return "多單止盈"
-    elif order_id.startswith("tp1_short"):
-        return "空單止盈"
-    elif order_id.startswith("trail_long"):
-        return "多單移動止損"
-    elif order_id.startswith("trail_short"):
-        return "空單移動止損"
-    elif order_id.startswith("stop_loss_long"):
-        return "多單止損"
-    elif order_id.startswith("stop_loss_short"):
-        return "空單止損"
-    elif order_id.startswith("breakeven_long"):
-        return "多單套保"
-    elif order_id.startswith("breakeven_short"):
-        return "空單套保"
-    elif order_id.startswith("residual_close_long"):
-        return "多單清殘倉"
-    elif order_id.startswith("residual_close_short"):
-        return "空單清殘倉"
-    elif order_id.startswith("close_long_for_short"):
-        return "多單反手轉空"
-    elif order_id.startswith("close_short_for_long"):
-        return "空單反手轉多"
+    # TV 通常直接送前綴本身：一次 dict 查詢；帶後綴的 order_id 才退回逐一 startswith
+    label = ORDER_ACTION_LABELS.get(order_id)
+    if label is not None:
+        return label
+    for prefix, label in ORDER_ACTION_LABELS.items():
+        if order_id.startswith(prefix):
+            return label
     return "unknown"
 
+# 🔐 webhook secret 用 compare_digest 做常數時間比對，避免逐位元組的 timing side channel
+WEBHOOK_SECRET_BYTES = os.getenv("WEBHOOK_SECRET", "letmein").encode()
+
+def webhook_secret_ok(secret) -> bool:
+    return isinstance(secret, str) and hmac.compare_digest(secret.encode(), WEBHOOK_SECRET_BYTES)
+
+# 🚪 先驗 secret 再做事：有帶 X-Webhook-Secret header 就在讀 body 前擋掉；
+#    TradingView 無法自訂 header，所以沒帶時退回檢查 body 裡的 secret。驗證失敗回 None
+async def read_authed_payload(request: Request) -> dict | None:
+    header_secret = request.headers.get("x-webhook-secret")
+    if header_secret is not None and not webhook_secret_ok(header_secret):
+        return None
+    payload = orjson.loads(await request.body())
+    if header_secret is None and not webhook_secret_ok(payload.get("secret", "")):
+        return None
+    return payload
+
+# 📤 webhook 路徑的固定回應先序列化成 bytes；直接回 Response 可跳過 FastAPI 的 jsonable_encoder + stdlib json
+def orjson_response(body: bytes | dict) -> Response:
+    if not isinstance(body, bytes):
+        body = orjson.dumps(body)
+    return Response(content=body, media_type="application/json")
+
+_OK_BODY               = orjson.dumps({"status": "ok"})
+_UNAUTHORIZED_BODY     = orjson.dumps({"status": "unauthorized"})
+_SKIP_NO_POSITION_BODY = orjson.dumps({"status": "skip_no_position"})
+# 固定內容的小端點（healthcheck 被 UptimeRobot 一直打）也先序列化好，每次只包一個 Response
+_RECEIVED_BODY    = orjson.dumps({"status": "received"})
+_HEALTH_BODY      = orjson.dumps({"status": "server is running"})
+_ROOT_BODY        = orjson.dumps({"message": "Webhook Server is live"})
+_LINE_STATUS_BODY = orjson.dumps({"line_notify_enabled": USE_LINE_NOTIFY})
+
 # ✅ 新增 LINE Callback 接收模組（放在 /webhook 前面）
 @app.post("/line_callback")
 async def line_callback(request: Request):
     try:
-        payload = await request.json()
+        payload = orjson.loads(await request.body())
         events = payload.get("events", [])
 
         for event in events:
@@ -240,225 +679,182 @@ async def line_callback(request: Request):
             message = event.get("message", {})
             msg_type = message.get("type", "")
 
-            print(f"[📩 LINE] 類型: {event_type}, 訊息類型: {msg_type}, 來源: {user_type}, userId: {user_id}{' | groupId: ' + group_id if group_id else ''}")
+            logger.info("[📩 LINE] 類型: %s, 訊息類型: %s, 來源: %s, userId: %s%s",
+                        event_type, msg_type, user_type, user_id, f" | groupId: {group_id}" if group_id else "")
     except Exception as e:
-        print("[⚠️ LINE Callback 處理失敗]", e)
-    return {"status": "received"}
+        logger.warning("[⚠️ LINE Callback 處理失敗] %s", e)
+    return orjson_response(_RECEIVED_BODY)
 
 # ✅ 新增 TradingView Webhook+Secret 專用入口
 @app.get("/equity_status")
 async def equity_status():
     try:
-        api_key = os.getenv("BYBIT_API_KEY")
-        api_secret = os.getenv("BYBIT_API_SECRET")
-        base_url = os.getenv("BYBIT_API_URL", "https://api-testnet.bybit.com")
-        endpoint = f"{base_url}/v5/account/wallet-balance?accountType=UNIFIED"
-
-        timestamp = str(int(time.time() * 1000))
-        recv_window = "5000"
-        sign_str = timestamp + api_key + recv_window
-        signature = hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
-        headers = {
-            "X-BAPI-API-KEY": api_key,
-            "X-BAPI-TIMESTAMP": timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window,
-            "X-BAPI-SIGN": signature
-        }
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(endpoint, headers=headers)
-            data = response.json()
-            raw_equity   = data["result"]["list"][0].get("totalEquity")
-            usdt_balance = safe_float(raw_equity)      # ← 自動處理空字串 / None
-            return {"status": "ok", "equity": usdt_balance}
+        raw_equity   = (await fetch_wallet_account()).get("totalEquity")
+        usdt_balance = safe_float(raw_equity)      # ← 自動處理空字串 / None
+        return {"status": "ok", "equity": usdt_balance}
     except Exception as e:
-        fallback = safe_float(os.getenv("EQUITY_FALLBACK", "100"))
-        return {"status": "fallback", "equity": fallback, "error": str(e)}
+        return {"status": "fallback", "equity": EQUITY_FALLBACK, "error": str(e)}
+
+# 每個 strategy_id 一把 asyncio.Lock，第一次用到時才建立
+_strategy_locks: collections.defaultdict = collections.defaultdict(asyncio.Lock)
 
 @app.post("/tv_webhook")
 async def tv_webhook(request: Request):
     try:
-        payload = await request.json()
-        if payload.get("secret", "") != os.getenv("WEBHOOK_SECRET", "letmein"):
-            return {"status": "unauthorized"}
-
-        strategy_id  = payload.get("strategy_id", "")
-        order_id     = payload.get("order_id", "")
-        trigger_type = payload.get("trigger_type", "")
-        comment      = payload.get("comment", "")
-        # 不再使用 TV payload 的 contracts
-        # contracts    = payload.get("contracts", None)
-        symbol       = payload.get("symbol", "")
+        raw = await read_authed_payload(request)
+        if raw is None:
+            return orjson_response(_UNAUTHORIZED_BODY)
+        payload = TVWebhookPayload.model_validate(raw)
+
+        strategy_id  = payload.strategy_id
+        order_id     = payload.order_id
+        trigger_type = payload.trigger_type
+        comment      = payload.comment
+        symbol       = payload.symbol
         if symbol.endswith(".P"): symbol = symbol[:-2]
-        price           = safe_float(payload.get("price"), 0.0)
-        capital_percent = safe_float(payload.get("capital_percent"), 0.0)
+        price           = payload.price
+        capital_percent = payload.capital_percent
         event        = order_id
         order_action = infer_action_from_order_id(order_id)
 
-        pine_time   = payload.get("time", "")
-        tz_tw       = timezone(timedelta(hours=8))
-        server_time = datetime.now(tz=tz_tw).strftime("%Y-%m-%d %H:%M:%S")
-
-        # 取餘額
-        api_key    = os.getenv("BYBIT_API_KEY")
-        api_secret = os.getenv("BYBIT_API_SECRET")
-        base_url   = os.getenv("BYBIT_API_URL", "https://api-testnet.bybit.com")
-        endpoint   = f"{base_url}/v5/account/wallet-balance?accountType=UNIFIED"
-
-        timestamp    = str(int(time.time() * 1000))
-        recv_window  = "5000"
-        query_string = "accountType=UNIFIED"
-        sign_str     = timestamp + api_key + recv_window + query_string
-        signature    = hmac.new(api_secret.encode(), sign_str.encode(), hashlib.sha256).hexdigest()
-        headers      = {
-            "X-BAPI-API-KEY": api_key,
-            "X-BAPI-TIMESTAMP": timestamp,
-            "X-BAPI-RECV-WINDOW": recv_window,
-            "X-BAPI-SIGN": signature
-        }
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(endpoint, headers=headers)
-                data = response.json()
-                print("[📦 Bybit API 回傳]", data)
-
-            usdt_info = next((c for c in data["result"]["list"][0]["coin"] if c["coin"] == "USDT"), None)
-            if usdt_info:
-                equity_str = (
-                    usdt_info.get("totalAvailableBalance")
-                    or usdt_info.get("availableToWithdraw")
-                    or usdt_info.get("equity")
-                )
-                equity = safe_float(equity_str, default=safe_float(os.getenv("EQUITY_FALLBACK", "100")))
+        pine_time   = payload.time
+        server_time = now_str()
+
+        # 🔒 同一策略的訊號依序處理：查倉位 → 下單之間不讓同策略的下一筆插隊，避免重複平倉；不同策略仍並行
+        async with _strategy_locks[strategy_id]:
+            # 取餘額（TTL 快取，見 cached_usdt_wallet）
+            try:
+                usdt_info = await cached_usdt_wallet()
+                if usdt_info:
+                    equity_str = (
+                        usdt_info.get("totalAvailableBalance")
+                        or usdt_info.get("availableToWithdraw")
+                        or usdt_info.get("equity")
+                    )
+                    equity = safe_float(equity_str, default=EQUITY_FALLBACK)
+                else:
+                    equity = EQUITY_FALLBACK
+            except Exception as e:
+                logger.warning("[⚠️ 無法取得 Bybit 賬戶餘額] %s", e)
+                equity = EQUITY_FALLBACK
+
+            # —— 先把TV傳的contracts讀回來（供 exit 下單參考）——
+            contracts = payload.contracts
+            # 拆解 order_id → action, direction, is_long（忽略 "rev" 後綴）
+            parts     = order_id.split("_")
+            action    = parts[0]
+            # parts 可能像 ["entry","long","rev"] 或 ["stop","loss","long"]
+            # 先看 parts[1]，若不是 long/short 再看 parts[2]
+            if len(parts) > 1 and parts[1] in ("long", "short"):
+                direction = parts[1]
+            elif len(parts) > 2 and parts[2] in ("long", "short"):
+                direction = parts[2]
             else:
-                equity = safe_float(os.getenv("EQUITY_FALLBACK", "100"))
-        except Exception as e:
-            print("[⚠️ 無法取得 Bybit 賬戶餘額]", e)
-            equity = safe_float(os.getenv("EQUITY_FALLBACK", "100"))
-
-        # —— 先把TV傳的contracts讀回來（供 exit 下單參考）——
-        contracts = safe_float(payload.get("contracts"), 0.0)
-        # 拆解 order_id → action, direction, is_long（忽略 "rev" 後綴）
-        parts     = order_id.split("_")
-        action    = parts[0]
-        # parts 可能像 ["entry","long","rev"] 或 ["stop","loss","long"]
-        # 先看 parts[1]，若不是 long/short 再看 parts[2]
-        if len(parts) > 1 and parts[1] in ("long", "short"):
-            direction = parts[1]
-        elif len(parts) > 2 and parts[2] in ("long", "short"):
-            direction = parts[2]
-        else:
-            direction = ""
-        is_long = (direction == "long")
-
-        # 根據 action 分流：entry 開倉，exit 類型減倉，其它不動
-        # 进到 tv_webhook 的 action 分流处，替换 entry 分支为：
-        if action == "entry" and price > 0 and capital_percent > 0:
-            # 修正最小下單單位為 0.01 ETH
-            avail    = equity
-            raw_qty  = (avail * capital_percent / 100) / price
-            min_unit = 0.01
-            qty      = math.floor(raw_qty / min_unit) * min_unit
-            if qty < min_unit:
-                order_result = {"retCode": None, "retMsg": "qty too small", "result": {}}
-            else:
-                side         = "Buy" if is_long else "Sell"
-                order_result = await place_order(symbol, side, qty)
+                direction = ""
+            is_long = (direction == "long")
+
+            # 根據 action 分流：entry 開倉，exit 類型減倉，其它不動
+            # 进到 tv_webhook 的 action 分流处，替换 entry 分支为：
+            if action == "entry" and price > 0 and capital_percent > 0:
+                # 修正最小下單單位為 0.01 ETH
+                avail    = equity
+                raw_qty  = (avail * capital_percent / 100) / price
+                min_unit = 0.01
+                qty      = math.floor(raw_qty / min_unit) * min_unit
+                if qty < min_unit:
+                    order_result = {"retCode": None, "retMsg": "qty too small", "result": {}}
+                else:
+                    side         = "Buy" if is_long else "Sell"
+                    order_result = await place_order(symbol, side, qty)
         
-        elif action in ("tp1", "stop", "trail", "breakeven", "residual"):
-            # 1) 查目前持倉
-            position_endpoint = f"{base_url}/v5/position/list?category=linear&symbol={symbol}"
-            ts           = str(int(time.time()*1000))
-            recv_window  = "5000"
-            qstr         = f"category=linear&symbol={symbol}"
-            sig          = hmac.new(api_secret.encode(), (ts+api_key+recv_window+qstr).encode(), hashlib.sha256).hexdigest()
-            pos_headers  = {"X-BAPI-API-KEY": api_key, "X-BAPI-TIMESTAMP": ts,
-                            "X-BAPI-RECV-WINDOW": recv_window, "X-BAPI-SIGN": sig}
-            async with httpx.AsyncClient() as client:
-                pos_data = (await client.get(position_endpoint, headers=pos_headers)).json()
+            elif action in ("tp1", "stop", "trail", "breakeven", "residual"):
+                # 1) 查目前持倉
+                position_endpoint = f"{BYBIT_BASE_URL}/v5/position/list?category=linear&symbol={symbol}"
+                ts           = bybit_ts()
+                qstr         = f"category=linear&symbol={symbol}"
+                sig          = bybit_sign(ts.encode() + BYBIT_SIGN_PREFIX_BYTES + qstr.encode())
+                pos_headers  = {**BYBIT_AUTH_HEADERS, "X-BAPI-TIMESTAMP": ts, "X-BAPI-SIGN": sig}
+                pos_data = orjson.loads((await app.state.http.get(position_endpoint, headers=pos_headers)).content)
         
-            # 2) 取得正確方向倉位大小
-            pos_side   = "Buy" if is_long else "Sell"
-            pos_size   = 0.0
-            for p in pos_data.get("result", {}).get("list", []):
-                if p.get("side") == pos_side:
-                    pos_size = safe_float(p.get("size"), 0.0)
-                    break
-
-            min_unit = 0.01
-            if pos_size < min_unit:                # 沒倉位：直接跳過、不寫 Sheet / Log
-                return {"status": "skip_no_position"}
-
-            # 3) 決定本次要平多少
-            close_qty = pos_size
-            if action == "tp1":                         # 只平 50%
-                close_qty = max(min_unit,
-                                round(pos_size * 0.5, 2))
-
-            # 4) 下平倉 Market 減倉單
-            side        = "Sell" if is_long else "Buy"
-            exit_result = await place_order(symbol, side, close_qty, reduce_only=True)
-
-            # 4-1) 立刻重新抓最新 equity（確保 Entry 與 Stop Loss 的餘額不同）
-            equity = await fetch_equity(api_key, api_secret, base_url)
-
-            order_result = {
-                "retCode": exit_result.get("retCode"),
-                "retMsg":  exit_result.get("retMsg"),
-                "result":  exit_result.get("result", {})
-            }
-            executed_qty = safe_float(
-                exit_result["result"].get("cumExecQty")
-                or exit_result["result"].get("execQty")
-                or exit_result["result"].get("qty"), 0.0)
-            contracts = executed_qty
-            qty       = executed_qty
+                # 2) 取得正確方向倉位大小
+                pos_side   = "Buy" if is_long else "Sell"
+                pos_size   = 0.0
+                for p in pos_data.get("result", {}).get("list", []):
+                    if p.get("side") == pos_side:
+                        pos_size = safe_float(p.get("size"), 0.0)
+                        break
+
+                min_unit = 0.01
+                if pos_size < min_unit:                # 沒倉位：直接跳過、不寫 Sheet / Log
+                    return orjson_response(_SKIP_NO_POSITION_BODY)
+
+                # 3) 決定本次要平多少
+                close_qty = pos_size
+                if action == "tp1":                         # 只平 50%
+                    close_qty = max(min_unit,
+                                    round(pos_size * 0.5, 2))
+
+                # 4) 下平倉 Market 減倉單
+                side        = "Sell" if is_long else "Buy"
+                exit_result = await place_order(symbol, side, close_qty, reduce_only=True)
+
+                # 4-1) 立刻重新抓最新 equity（確保 Entry 與 Stop Loss 的餘額不同）
+                equity = await fetch_equity()
+
+                order_result = {
+                    "retCode": exit_result.get("retCode"),
+                    "retMsg":  exit_result.get("retMsg"),
+                    "result":  exit_result.get("result", {})
+                }
+                executed_qty = safe_float(
+                    exit_result["result"].get("cumExecQty")
+                    or exit_result["result"].get("execQty")
+                    or exit_result["result"].get("qty"), 0.0)
+                contracts = executed_qty
+                qty       = executed_qty
 
-        else:
-            # 不符合下單條件
-            qty = 0.0
-            reason = "invalid price/cap_percent" if action == "entry" else "not entry"
-            order_result = {"retCode": None, "retMsg": reason, "result": {}}
+            else:
+                # 不符合下單條件
+                qty = 0.0
+                reason = "invalid price/cap_percent" if action == "entry" else "not entry"
+                order_result = {"retCode": None, "retMsg": reason, "result": {}}
 
         
-        # —— 共用：解析下單回傳 —— 
-        ret_code = order_result.get("retCode")
-        ret_msg  = order_result.get("retMsg")
-        pnl      = order_result.get("result", {}).get("cumRealisedPnl", None)
-
-        # 如果是 Exit 分支，再解析並覆寫成交量（Entry 不受影響）
-        if action in ("tp1", "stop", "trail", "breakeven", "residual"):
-            executed_qty = safe_float(
-                order_result.get("result", {}).get("cumExecQty")
-                or order_result.get("result", {}).get("execQty")
-                or order_result.get("result", {}).get("qty"),
-                0.0
-            )
-            # 僅在 Exit 時用 Bybit 回傳量覆寫
-            contracts = executed_qty
-            qty       = executed_qty
-        # ——————————————————————————————————————————————————————————————
-
-        # 寫入 log.json
-        with open(log_json_path, "r+") as f:
-            logs = json.load(f)
-            logs.append({
-                "pine_time": pine_time,
-                "server_time": server_time,
-                "strategy_id": strategy_id,
-                "event": event,
-                "trigger_type": trigger_type,
-                "comment": comment,
-                "contracts": contracts,
-                "equity": equity,
-                "order_action": order_action,
-                "ret_code": ret_code,
-                "ret_msg": ret_msg,
-                "pnl": pnl,
-                "price": price,
-                "qty": qty
-            })
-            f.seek(0); json.dump(logs, f, indent=2)
+            # —— 共用：解析下單回傳 —— 
+            ret_code = order_result.get("retCode")
+            ret_msg  = order_result.get("retMsg")
+            pnl      = order_result.get("result", {}).get("cumRealisedPnl", None)
+
+            # 如果是 Exit 分支，再解析並覆寫成交量（Entry 不受影響）
+            if action in ("tp1", "stop", "trail", "breakeven", "residual"):
+                executed_qty = safe_float(
+                    order_result.get("result", {}).get("cumExecQty")
+                    or order_result.get("result", {}).get("execQty")
+                    or order_result.get("result", {}).get("qty"),
+                    0.0
+                )
+                # 僅在 Exit 時用 Bybit 回傳量覆寫
+                contracts = executed_qty
+                qty       = executed_qty
+            # ——————————————————————————————————————————————————————————————
+
+        # 寫入 log.jsonl（丟進 queue，由 log_worker 背景批次寫入）
+        log_event({
+            "pine_time": pine_time,
+            "server_time": server_time,
+            "strategy_id": strategy_id,
+            "event": event,
+            "trigger_type": trigger_type,
+            "comment": comment,
+            "contracts": contracts,
+            "equity": equity,
+            "order_action": order_action,
+            "ret_code": ret_code,
+            "ret_msg": ret_msg,
+            "pnl": pnl,
+            "price": price,
+            "qty": qty
+        })
 
         # 寫入 Google Sheets
         if sheet:
@@ -472,52 +868,49 @@ async def tv_webhook(request: Request):
                 pnl, price, qty
             )
 
-        return {"status": "ok"}
+        return orjson_response(_OK_BODY)
     except Exception as e:
-        print(f"[⚠️ TV Webhook 錯誤]：{e}")
-        return {"status": "error", "message": str(e)}
+        logger.error("[⚠️ TV Webhook 錯誤]：%s", e)
+        return orjson_response({"status": "error", "message": str(e)})
         
 @app.post("/tv_webhook_test")
 async def tv_webhook_test(request: Request):
     try:
-        payload = await request.json()
-        if payload.get("secret", "") != os.getenv("WEBHOOK_SECRET", "letmein"):
-            return {"status": "unauthorized"}
+        raw = await read_authed_payload(request)
+        if raw is None:
+            return orjson_response(_UNAUTHORIZED_BODY)
+        payload = TVWebhookPayload.model_validate(raw)
 
-        strategy_id  = payload.get("strategy_id", "")
-        order_id     = payload.get("order_id", "")
+        strategy_id  = payload.strategy_id
+        order_id     = payload.order_id
         action       = "Buy" if "long" in order_id else "Sell"
-        symbol       = payload.get("symbol", "")
-        price        = safe_float(payload.get("price"))
-        trigger_type = payload.get("trigger_type", "")
+        symbol       = payload.symbol
+        price        = payload.price
+        trigger_type = payload.trigger_type
 
-        pine_time   = payload.get("time", "")
-        tz_tw       = timezone(timedelta(hours=8))
-        server_time = datetime.now(tz=tz_tw).strftime("%Y-%m-%d %H:%M:%S")
+        pine_time   = payload.time
+        server_time = now_str()
 
         await place_order(symbol, action, 0.01)
 
-        # log.json
-        with open(log_json_path, "r+") as f:
-            logs = json.load(f)
-            logs.append({
-                "pine_time": pine_time,
-                "server_time": server_time,
-                "strategy_id": strategy_id,
-                "event": order_id + "_test",
-                "equity": None,
-                "drawdown": None,
-                "order_action": action,
-                "trigger_type": trigger_type,
-                "comment": None,
-                "contracts": None,
-                "ret_code": None,
-                "ret_msg": None,
-                "pnl": None,
-                "price": price,
-                "qty": 0.01
-            })
-            f.seek(0); json.dump(logs, f, indent=2)
+        # log.jsonl
+        log_event({
+            "pine_time": pine_time,
+            "server_time": server_time,
+            "strategy_id": strategy_id,
+            "event": order_id + "_test",
+            "equity": None,
+            "drawdown": None,
+            "order_action": action,
+            "trigger_type": trigger_type,
+            "comment": None,
+            "contracts": None,
+            "ret_code": None,
+            "ret_msg": None,
+            "pnl": None,
+            "price": price,
+            "qty": 0.01
+        })
 
         # Google Sheets
         if sheet:
@@ -531,20 +924,49 @@ async def tv_webhook_test(request: Request):
                 price, 0.01
             )
 
-        return {"status": "ok"}
+        return orjson_response(_OK_BODY)
     except Exception as e:
-        print(f"[⚠️ TV 測試 webhook 錯誤]：{e}")
-        return {"status": "error", "message": str(e)}
+        logger.error("[⚠️ TV 測試 webhook 錯誤]：%s", e)
+        return orjson_response({"status": "error", "message": str(e)})
 
 
 # 🗂️ 15 列完整版 /webhook
-@app.post("/webhook")
-async def webhook_handler(payload: WebhookPayload):
-    # 0. Pine 時間（假設前端已傳 "time" 欄位，格式同 tv_webhook）
-    pine_time   = payload.__dict__.get("time", "")  
+# 📑 body 自己解析，OpenAPI 的 request schema 要手動補上，/docs 才看得到欄位；
+#    pydantic 把巢狀 model 放在 "$defs"，openapi.json 根層沒有這一節，所以把 $ref 就地展開
+def inline_json_schema(model: type[BaseModel]) -> dict:
+    schema = model.model_json_schema()
+    defs = schema.pop("$defs", {})
+
+    def resolve(node):
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if ref and ref.startswith("#/$defs/"):
+                return resolve(defs[ref.removeprefix("#/$defs/")])
+            return {k: resolve(v) for k, v in node.items()}
+        if isinstance(node, list):
+            return [resolve(v) for v in node]
+        return node
+
+    return resolve(schema)
+
+@app.post("/webhook", openapi_extra={"requestBody": {
+    "required": True,
+    "content": {"application/json": {"schema": inline_json_schema(WebhookPayload)}},
+}})
+async def webhook_handler(request: Request):
+    # pydantic v2（Rust core）直接從 raw body 解析 + 驗證，不經 FastAPI 先 json.loads 再驗一次
+    body = await request.body()
+    try:
+        payload = WebhookPayload.model_validate_json(body)
+    except ValidationError as e:
+        # 與 FastAPI 自己驗 body 時同格式：loc 前綴 "body"，交給預設的 422 handler 輸出
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)], body=body)
+
+    # 0. Pine 時間（前端已傳 "time" 欄位，格式同 tv_webhook）
+    pine_time   = payload.time
     # 1. Server 接收時戳（台北時區）
-    tz_tw       = timezone(timedelta(hours=8))
-    server_time = datetime.now(tz=tz_tw).strftime("%Y-%m-%d %H:%M:%S")
+    server_time = now_str()
 
     # 2. 其它欄位解包
     strategy_id  = payload.strategy_id
@@ -575,7 +997,7 @@ async def webhook_handler(payload: WebhookPayload):
         qty
     )
 
-    return {"status": "ok", "strategy_id": strategy_id}
+    return orjson_response({"status": "ok", "strategy_id": strategy_id})
 
 
 # ✅ 健康檢查路由，支援 GET 與 HEAD 請求（避免 405 錯誤）
@@ -584,94 +1006,158 @@ async def webhook_handler(payload: WebhookPayload):
 
 @app.api_route("/healthcheck", methods=["GET", "HEAD"])
 async def healthcheck():
-    return {"status": "server is running"}
+    return orjson_response(_HEALTH_BODY)
 
 @app.get("/test_line")
 async def test_line():
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     strategy_id = "TEST_LINE"
     event = "test_line_triggered"
-    write_to_gsheet(timestamp, strategy_id, event)
+    write_to_gsheet("", now_str(), strategy_id, event)   # 沒有 Pine 時間，pine_time 留空
     await push_line_message("📢 測試訊息：LINE 通知測試成功！")
     return {"status": "ok"}
 
 @app.get("/line_status")
 async def line_status():
-    use_line = os.getenv("USE_LINE_NOTIFY", "false").lower() == "true"
-    return {"line_notify_enabled": use_line}
+    return orjson_response(_LINE_STATUS_BODY)
 
 # ✅ 新增 /status 查詢策略狀態 API
 @app.get("/status")
 async def check_strategy_status(strategy_id: str):
     try:
-        with open("log/log.json", "r") as f:
-            records = json.load(f)
-        matched = [r for r in records if r.get("strategy_id") == strategy_id]
-        if matched:
-            return {"status": "found", "count": len(matched)}
+        if _strategy_counts is not None:
+            count = _strategy_counts.get(strategy_id, 0)
+        else:   # 第一次查詢要掃全部 log 檔建索引，丟 thread
+            count = await asyncio.to_thread(count_strategy_logs, strategy_id)
+        if count:
+            return {"status": "found", "count": count}
         else:
             return {"status": "not found"}
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
-@app.get("/logs_dashboard", response_class=HTMLResponse)
-async def show_logs_dashboard(request: Request):
-    try:
-        with open("log/log.json", "r") as f:
-            records = json.load(f)
-    except Exception as e:
-        print(f"[⚠️ log.json 載入失敗]：{e}")
-        records = []
+# 🏷️ "A203_ETHUSDT_1" → "A203_ETHUSDT"（只切一次，不足兩段時原樣回傳）
+#    策略 ID 就那幾個，結果記起來，dashboard 重渲染時不必每列重新 split + join
+@functools.lru_cache(maxsize=1024)
+def strategy_base_id(strategy_id: str) -> str:
+    return "_".join(strategy_id.split("_", 2)[:2])
+
+# 📈 圖表由瀏覽器端 Chart.js 畫：server 只算出統計數字，隨 /logs.json 一起送出，不產 PNG
+MDD_HIST_BINS = 10
+
+def dashboard_chart_data(records: list) -> dict:
+    # 🔁 一次掃過 records 同時累計勝率分子分母、MDD 與 equity，不再分好幾輪各掃一遍
+    win_count = total_orders = 0
+    # 📊 數值直接收進 C double buffer，np.frombuffer 零複製轉成 ndarray，分箱交給 NumPy
+    mdd_buf, equity_buf = array.array("d"), array.array("d")
+    for r in records:
+        event = r.get("event")
+        if event == "order_sent":
+            win_count += 1
+        elif event in ("entry_long", "entry_short"):
+            total_orders += 1
+        dd = r.get("drawdown")
+        if dd is not None:
+            mdd_buf.append(safe_float(dd))
+        eq = r.get("equity")
+        if eq is not None:
+            equity_buf.append(safe_float(eq))
+    mdd_arr = np.frombuffer(mdd_buf, dtype=np.float64)
+    mdd_counts, mdd_edges = np.histogram(mdd_arr, bins=MDD_HIST_BINS) if mdd_arr.size else ([], [])
+    return {
+        "win_rate": (win_count / total_orders * 100) if total_orders else 0,
+        "equity": equity_buf.tolist(),
+        "mdd_counts": list(map(int, mdd_counts)),
+        "mdd_edges": [round(float(x), 2) for x in mdd_edges],
+    }
 
-    try:
-        strategy_counts = collections.Counter(r["strategy_id"].split("_")[0] + "_" + r["strategy_id"].split("_")[1] for r in records)
-        win_count = sum(1 for r in records if r["event"] == "order_sent")
-        total_orders = sum(1 for r in records if r["event"] in ["entry_long", "entry_short"])
-        win_rate = (win_count / total_orders * 100) if total_orders else 0
-
-        mdd_list = [r["drawdown"] for r in records if r["drawdown"] is not None]
-        equity_list = [r["equity"] for r in records if r["equity"] is not None]
-
-        if mdd_list:
-            plt.figure(figsize=(4, 3))
-            plt.hist(mdd_list, bins=10)
-            plt.title("MDD 分佈圖")
-            plt.tight_layout()
-            plt.savefig("static/mdd_distribution.png")
-        else:
-            print("[⚠️ MDD 無資料]")
-
-        if equity_list:
-            plt.figure(figsize=(4, 3))
-            plt.plot(equity_list)
-            plt.title("Equity 曲線")
-            plt.tight_layout()
-            plt.savefig("static/equity_curve.png")
-        else:
-            print("[⚠️ Equity 無資料]")
-
-        plt.figure(figsize=(3, 3))
-        plt.bar(["Win Rate"], [win_rate])
-        plt.title(f"Win Rate: {win_rate:.1f}%")
-        plt.ylim(0, 100)
-        plt.tight_layout()
-        plt.savefig("static/win_rate.png")
-    except Exception as e:
-        print("[⚠️ 圖表產生失敗]", e)
+# 📦 dashboard 資料一包 JSON：表格列（新→舊，只留顯示欄位）、下拉選單策略清單（去重）、圖表統計
+def build_dashboard_payload(records: list) -> bytes:
+    rows, base_ids = [], {}
+    rows_append = rows.append
+    for r in reversed(records):
+        strategy_id = r.get("strategy_id") or ""
+        rows_append((
+            r.get("timestamp") or r.get("server_time") or "",
+            strategy_id,
+            r.get("event") or "",
+            r.get("equity"),
+            r.get("drawdown"),
+            r.get("order_action") or "",
+        ))
+        base_ids[strategy_base_id(strategy_id)] = None
+    return orjson.dumps({"rows": rows, "strategy_ids": list(base_ids), "charts": dashboard_chart_data(records)})
+
+@app.get("/logs.json")
+async def logs_json(request: Request):
+    # 🧠 log 版本沒變就回 304 或上次序列化好的 bytes
+    cache_key = log_state.version
+    cache_headers = {
+        "ETag": f'"{_BOOT_ID}-{cache_key:x}"',
+        "Last-Modified": formatdate(log_state.updated, usegmt=True),
+        # 沒有 Cache-Control 時瀏覽器會依 Last-Modified 做啟發式快取、不回來驗證；no-cache 逼每次都帶 ETag 問一次
+        "Cache-Control": "no-cache",
+    }
+    if request.headers.get("if-none-match") == cache_headers["ETag"]:
+        return Response(status_code=304, headers=cache_headers)
+    if log_state.payload_version != cache_key:
+        log_state.payload_version, log_state.payload = cache_key, build_dashboard_payload(list(recent_logs))
+    return Response(content=log_state.payload, media_type="application/json", headers=cache_headers)
 
-    return templates.TemplateResponse("logs_dashboard.html", {"request": request, "records": records, "seen_ids": []})
+# 🖥️ dashboard 本身是靜態頁（FileResponse 直接送檔，瀏覽器可快取），表格與圖表由頁面 fetch /logs.json 後在前端畫
+DASHBOARD_HTML_PATH = "static/logs_dashboard.html"
 
+@app.get("/logs_dashboard", response_class=HTMLResponse)
+async def show_logs_dashboard():
+    return FileResponse(DASHBOARD_HTML_PATH, media_type="text/html")
+
+# 📥 下載 log.jsonl 的快照：請求開始時開檔並 fstat，只送到當下的大小為止。
+#    FileResponse 會一路讀到 EOF，下載途中 webhook 繼續追加就會超過 Content-Length、連線被 uvicorn 切斷；
+#    writer 每批一次 write 整行追加，快照結尾不會是半行。已開的 fd 跟著 inode 走，途中輪替也不受影響
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def _iter_file_snapshot(f, size: int):
+    # 同步 generator：StreamingResponse 會丟到 threadpool 逐塊讀，不卡 event loop
+    with f:
+        remaining = size
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+@app.get("/download/log.jsonl")
+async def download_log():
+    f = open(log_jsonl_path, "rb")
+    size = os.fstat(f.fileno()).st_size
+    # log 隨時在長，不讓瀏覽器 / proxy 快取舊版本
+    return StreamingResponse(_iter_file_snapshot(f, size), media_type="application/x-ndjson", headers={
+        "Content-Length": str(size),
+        "Content-Disposition": 'attachment; filename="log.jsonl"',
+        "Cache-Control": "no-cache",
+    })
+
+# ↪️ 舊網址保留：既有書籤 / 腳本改導向 JSONL 下載，不會 404；JSONL 是一行一筆，不再是單一 JSON 陣列
 @app.get("/download/log.json")
-def download_log():
-    return FileResponse("log/log.json", media_type="application/json", filename="log.json")
+async def download_log_legacy():
+    return RedirectResponse("/download/log.jsonl")
+
+# 🔐 reset 密碼同樣用 compare_digest 常數時間比對；form 欄位可能是 None / UploadFile，非字串一律拒絕
+RESET_SECRET_BYTES = os.getenv("RESET_SECRET", "letmein").encode()
+
+def reset_secret_ok(secret) -> bool:
+    return isinstance(secret, str) and hmac.compare_digest(secret.encode(), RESET_SECRET_BYTES)
+
+# 🔁 重置策略：記一列 manual_reset 到 Sheets，LINE 通知在背景送
+def _do_reset(strategy_id: str):
+    write_to_gsheet("", now_str(), strategy_id, "manual_reset")
+    notify_line(f"🔁 手動重置策略：{strategy_id}")
 
 @app.post("/reset_strategy")
 async def reset_strategy(request: Request):
-    expected_secret = os.getenv("RESET_SECRET", "letmein")
-
     try:
         if request.headers.get("content-type", "").startswith("application/json"):
-            data = await request.json()
+            data = orjson.loads(await request.body())
             strategy_id = data.get("strategy_id")
             reset_secret = data.get("reset_secret")
         else:
@@ -679,26 +1165,23 @@ async def reset_strategy(request: Request):
             strategy_id = form.get("strategy_id")
             reset_secret = form.get("reset_secret")
 
-        if reset_secret != expected_secret:
+        if not reset_secret_ok(reset_secret):
             return HTMLResponse(content="<h1>密碼錯誤，請重新輸入。</h1>", status_code=403)
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        write_to_gsheet(timestamp, strategy_id, "manual_reset")
-        await push_line_message(f"🔁 手動重置策略：{strategy_id}")
+        _do_reset(strategy_id)
         return RedirectResponse(url="/logs_dashboard", status_code=302)
     except Exception as e:
-        print("[⚠️ Reset Strategy 處理失敗]", e)
+        logger.error("[⚠️ Reset Strategy 處理失敗] %s", e)
         return HTMLResponse(content="<h1>內部錯誤</h1>", status_code=500)
 
 # ✅ 新增根目錄首頁，避免 Render 預設 GET / 回傳 404
 @app.get("/")
 async def root():
-    return {"message": "Webhook Server is live"}
+    return orjson_response(_ROOT_BODY)
 
-@app.get("/settings_dashboard", response_class=HTMLResponse)
-async def settings_dashboard():
-    use_line = os.getenv("USE_LINE_NOTIFY", "false").lower() == "true"
-    use_line_status = "✅ 已啟用" if use_line else "❌ 未啟用"
+# ⚙️ 設定頁內容只跟 USE_LINE_NOTIFY 有關（import 時就固定），整頁 HTML 組一次存成 bytes
+def build_settings_html() -> str:
+    use_line_status = "✅ 已啟用" if USE_LINE_NOTIFY else "❌ 未啟用"
 
     html = f"""
     <html>
@@ -817,24 +1300,31 @@ async def settings_dashboard():
     </body>
     </html>
     """
-    return HTMLResponse(content=html)
+    return html
 
-@app.post("/trigger_reset")
-async def trigger_reset():
-    strategy_id = "TEST_STRATEGY"
-    reset_secret = os.getenv("RESET_SECRET", "letmein")
+SETTINGS_HTML = build_settings_html().encode()
 
-    form = {
-        "strategy_id": strategy_id,
-        "reset_secret": reset_secret,
-    }
+@app.get("/settings_dashboard", response_class=HTMLResponse)
+async def settings_dashboard():
+    return HTMLResponse(content=SETTINGS_HTML)
 
+# 設定頁的測試按鈕：直接呼叫 _do_reset，不再繞 HTTP 打自己的 /reset_strategy
+@app.post("/trigger_reset")
+async def trigger_reset():
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.post("http://localhost:10000/reset_strategy", data=form)
-            if res.status_code == 302 or "logs_dashboard" in res.text:
-                return {"status": "success"}
-            else:
-                return {"status": "failed", "detail": res.text}
+        _do_reset("TEST_STRATEGY")
+        return {"status": "success"}
     except Exception as e:
         return {"status": "error", "error": str(e)}
+
+# 🚀 python bybit_a203_ethusdt.py 直接啟動：uvloop + httptools；單一 worker（見 app 建立處的說明）
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(
+        app,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", "10000")),
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+    )